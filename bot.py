@@ -1,19 +1,168 @@
 # Not meant to be executed by itself, call the script from trainer.py
 
-import copy
-import heapq
-from collections import deque
+
+# bitboards: each side is a 144-bit int with bit (row * 12 + column) set for every disc it owns
+FULL = (1 << 144) - 1
+# every square except those in the first (resp. last) column, stops shifts from wrapping onto the next row
+NOT_FIRST_COL = sum(1 << (i * 12 + j) for i in range(12) for j in range(1, 12))
+NOT_LAST_COL = sum(1 << (i * 12 + j) for i in range(12) for j in range(11))
+CORNERS = (1 << 0) | (1 << 11) | (1 << 132) | (1 << 143)
+# central 64 tiles, c3 to j10
+CENTER = sum(1 << (i * 12 + j) for i in range(2, 10) for j in range(2, 10))
+# shift amount of each direction pair (E/W, SW/NE, S/N, SE/NW) and where a line of flipped discs may lie;
+# a horizontal or diagonal line can never pass through an edge column, which also catches wrap-around
+DIRECTIONS = ((1, NOT_FIRST_COL & NOT_LAST_COL), (11, NOT_FIRST_COL & NOT_LAST_COL), (12, FULL),
+              (13, NOT_FIRST_COL & NOT_LAST_COL))
+# bits given to each board of a stack (see stack_masks()): 12 rows and an empty row, so shifts off a board's last row
+# land in that row and never on the next board
+STACK_SLOT = 13 * 12
+# discs of O and of X when a game starts: O on d3, c4, j9, i10 and X on c3, d4, i9, j10
+START_O = (1 << 27) | (1 << 38) | (1 << 105) | (1 << 116)
+START_X = (1 << 26) | (1 << 39) | (1 << 104) | (1 << 117)
+# width of the windows principal variation search uses to prove a move is no better than the best so far
+NULL_WINDOW = 1e-6
+
+
+def popcount(bits):
+    return bin(bits).count("1")
+
+
+# all squares where player can move, found by sliding along lines of opponent discs in all 8 directions at once;
+# full and directions as given by stack_masks() find the moves of a whole stack of boards at once
+def find_moves(player, opponent, full=FULL, directions=DIRECTIONS):
+    empty = ~(player | opponent) & full
+    moves = 0
+    for shift, mask in directions:
+        inner = opponent & mask
+        line = (player << shift) & inner
+        while line:
+            line <<= shift
+            moves |= line & empty
+            line &= inner
+        line = (player >> shift) & inner
+        while line:
+            line >>= shift
+            moves |= line & empty
+            line &= inner
+    return moves
+
+
+# FULL and DIRECTIONS repeated for at least count boards side by side, STACK_SLOT bits apart; made once for each
+# power of 2, as play_games() stacks a different count of boards every step and unused slots find no moves anyway
+stacked_masks = {}
+
+
+def stack_masks(count):
+    slots = 1 << (count - 1).bit_length()
+    if slots not in stacked_masks:
+        repeat = sum(1 << (i * STACK_SLOT) for i in range(slots))
+        stacked_masks[slots] = FULL * repeat, tuple((shift, mask * repeat) for shift, mask in DIRECTIONS)
+    return stacked_masks[slots]
+
+
+# moves of each (player, opponent) of boards, found by one pass of find_moves() over all of them stacked side by side
+def find_moves_stacked(boards):
+    full, directions = stack_masks(len(boards))
+    player = 0
+    opponent = 0
+    for i, (mine, theirs) in enumerate(boards):
+        player |= mine << (i * STACK_SLOT)
+        opponent |= theirs << (i * STACK_SLOT)
+    moves = find_moves(player, opponent, full, directions)
+    return [moves >> (i * STACK_SLOT) & FULL for i in range(len(boards))]
+
+
+# discs flipped if player moves at square, 0 if the move is invalid
+def find_flips(player, opponent, square):
+    bit = 1 << square
+    flips = 0
+    for shift, mask in DIRECTIONS:
+        inner = opponent & mask
+        line = 0
+        cur = (bit << shift) & inner
+        while cur:
+            line |= cur
+            cur <<= shift
+            # line of opponent discs capped by a player disc
+            if cur & player:
+                flips |= line
+                break
+            cur &= inner
+        line = 0
+        cur = (bit >> shift) & inner
+        while cur:
+            line |= cur
+            cur >>= shift
+            if cur & player:
+                flips |= line
+                break
+            cur &= inner
+    return flips
+
+
+# bits plus every tile next to them, diagonals included
+def dilate(bits):
+    bits |= ((bits << 1) & NOT_FIRST_COL) | ((bits >> 1) & NOT_LAST_COL)
+    return (bits | (bits << 12) | (bits >> 12)) & FULL
+
+
+# grows seed into every disc of discs it is joined to (vertically, horizontally, or diagonally)
+def flood_fill(seed, discs):
+    while True:
+        grown = seed | ((seed << 1) & NOT_FIRST_COL) | ((seed >> 1) & NOT_LAST_COL)
+        grown = (grown | (grown << 12) | (grown >> 12)) & discs
+        if grown == seed:
+            return seed
+        seed = grown
+
+
+# separated groups (clusters joined vertically, horizontally, or diagonally) as bitboards, flood filled one at a time
+def find_groups(discs):
+    groups = []
+    while discs:
+        groups.append(flood_fill(discs & -discs, discs))
+        discs ^= groups[-1]
+    return groups
+
+
+# converts 12x12 list board into (player, opponent) bitboards from the view of side
+def to_bitboards(side, state):
+    player = 0
+    opponent = 0
+    for i in range(12):
+        for j in range(12):
+            if state[i][j] == side:
+                player |= 1 << (i * 12 + j)
+            elif state[i][j] != '.':
+                opponent |= 1 << (i * 12 + j)
+    return player, opponent
+
+
+# converts bitboards back into a 12x12 list board, player's discs belonging to side
+def to_state(side, player, opponent):
+    other = "O" if side == "X" else "X"
+    state = []
+    for i in range(12):
+        row = []
+        for j in range(12):
+            bit = 1 << (i * 12 + j)
+            row.append(side if player & bit else other if opponent & bit else '.')
+        state.append(row)
+    return state
 
 
 class Board:
-    def __init__(self, h_val, side, state):
-        # modifies heuristic values in heuristics() function
-        self.a1, self.a2, self.b1, self.b2, self.c1, self.c2, \
-            self.d1, self.d2, self.e1, self.e2 = h_val
+    def __init__(self, h_val, side, player, opponent):
+        self.set_heuristic(h_val)
         self.side = side
-        self.state = state
-        # player valid moves, format [(x,y), [(x1,y1),(x2,y2)...]] i.e. move at (x,y) flips discs (x1,y1)...
-        self.pmoves = []
+        # player and opponent discs as bitboards
+        self.player = player
+        self.opponent = opponent
+        # player valid moves as a bitboard, expanded into pmoves only when the move list is needed
+        self.moves = 0
+        self.pmove_list = None
+        # player valid move count
+        self.pmove_count = 0
         # opponent valid moves
         self.omoves = 0
         # player disc count
@@ -24,105 +173,170 @@ class Board:
         self.pcenter = 0
         # opponent center disc count
         self.ocenter = 0
-        # player groups
+        # player groups, and each group as a bitboard
         self.pgroup = 0
-        # opponent groups
+        self.pgroups = []
+        # opponent groups, and each group as a bitboard
         self.ogroup = 0
+        self.ogroups = []
+        # False while the values above are out of date with the discs, after a play() that skipped evaluating
+        self.evaluated = False
+        # values above saved before each move played in place, restored by undo()
+        self.history = []
+        self.evaluate()
+
+    # modifies heuristic values in heuristics() function
+    def set_heuristic(self, h_val):
+        self.a1, self.a2, self.b1, self.b2, self.c1, self.c2, \
+            self.d1, self.d2, self.e1, self.e2 = h_val
+
+    # recomputes everything derived from the discs, needed whenever the discs change
+    def evaluate(self):
         self.scan_board()
+        self.scan_moves()
         self.heuristic, self.isLeaf = self.heuristics()
+        self.evaluated = True
 
-    def scan_board(self):
-        visited = [[0 for _ in range(12)] for _ in range(12)]
-        for i in range(12):
-            for j in range(12):
-                if visited[i][j]:
-                    continue
-                if self.state[i][j] == '.':
-                    self.check_move(i, j)
-                    visited[i][j] = 1
+    # same as evaluate() after the move just played, changing disc, center and group counts by what the move changed
+    # changed is the placed disc and its flips; only groups next to them are looked at again
+    def update(self, changed, flips):
+        self.update_discs(changed, flips)
+        self.scan_moves()
+        self.heuristic, self.isLeaf = self.heuristics()
+        self.evaluated = True
+
+    # the disc, center and group counts of update()
+    def update_discs(self, changed, flips):
+        nflips = popcount(flips)
+        ncenter = popcount(flips & CENTER)
+        # the side that just moved is now the opponent
+        self.pcount, self.ocount = self.ocount - nflips, self.pcount + popcount(changed)
+        self.pcenter, self.ocenter = self.ocenter - ncenter, self.pcenter + popcount(changed & CENTER)
+        pgroups, ogroups = self.ogroups, self.pgroups
+        if changed:
+            # placed disc and flips are one group, merging every group of the mover next to them
+            near = dilate(changed)
+            merged = changed
+            ogroups = []
+            for group in self.pgroups:
+                if group & near:
+                    merged |= group
                 else:
-                    count, center = self.count_group(self.state[i][j], i, j, visited)
-                    if self.state[i][j] == self.side:
-                        self.pcount += count
-                        self.pcenter += center
-                        self.pgroup += 1
-                    else:
-                        self.ocount += count
-                        self.ocenter += center
-                        self.ogroup += 1
-
-    # checks if valid move
-    def check_move(self, startx, starty):
-        # transformations to the 8 surrounding tiles
-        dx = [-1, 0, 1, -1, 1, -1, 0, 1]
-        dy = [1, 1, 1, 0, 0, -1, -1, -1]
-        # flag to avoid duplicate counting of opponent's moves
-        flag = 0
-        for i in range(8):
-            curx = startx + dx[i]
-            cury = starty + dy[i]
-            side = '.'
-            while 0 <= curx < 12 and 0 <= cury < 12:
-                # hits empty tile, either right away or after a line of only 1 color, invalid move
-                if self.state[curx][cury] == '.':
-                    break
-                # hits occupied tile the first time
-                elif side == '.':
-                    side = self.state[curx][cury]
-                    # opponent move already counted in previous iteration
-                    if flag and self.side == side:
-                        break
-                # hits occupied tile that does not match the first tile hit (else move on)
-                elif self.state[curx][cury] != side:
-                    # valid move for opponent
-                    if self.side == side:
-                        self.omoves += 1
-                        flag = 1
-                    # valid move for player, calculate affected discs if this move was made
-                    else:
-                        # new move (flag equivalent to avoid duplicate counting of player's moves)
-                        if not self.pmoves or self.pmoves[-1][0] != (startx, starty):
-                            self.pmoves.append([(startx, starty), []])
-                        while curx - dx[i] != startx or cury - dy[i] != starty:
-                            self.pmoves[-1][1].append((curx - dx[i], cury - dy[i]))
-                            curx -= dx[i]
-                            cury -= dy[i]
-                    break
-                curx += dx[i]
-                cury += dy[i]
-
-    # bfs to scan complete group
-    def count_group(self, side, startx, starty, visited):
-        dx = [-1, 0, 1, -1, 1, -1, 0, 1]
-        dy = [1, 1, 1, 0, 0, -1, -1, -1]
-        queue = deque([(startx, starty)])
-        count = 0
-        center = 0
-        visited[startx][starty] = 1
-        while queue:
-            curx, cury = queue.popleft()
-            count += 1
-            if 1 < curx < 10 and 1 < cury < 10:
-                center += 1
-            for i in range(8):
-                if 0 <= curx + dx[i] < 12 and 0 <= cury + dy[i] < 12 and \
-                        not visited[curx + dx[i]][cury + dy[i]] and self.state[curx + dx[i]][cury + dy[i]] == side:
-                    queue.append((curx + dx[i], cury + dy[i]))
-                    visited[curx + dx[i]][cury + dy[i]] = 1
-        return count, center
+                    ogroups.append(group)
+            ogroups.append(merged)
+        if flips:
+            # groups that lost flipped discs may split apart, or vanish if flipped whole
+            pgroups = []
+            for group in self.ogroups:
+                if group & flips:
+                    pgroups += find_groups(group ^ (group & flips))
+                else:
+                    pgroups.append(group)
+        self.pgroups, self.ogroups = pgroups, ogroups
+        self.pgroup, self.ogroup = len(pgroups), len(ogroups)
+
+    # plays move (None to pass) in place and hands the turn over, flips being the bitboard recorded in pmoves
+    # skip evaluate for boards that are never looked at beyond their side, e.g. leaves already scored
+    def play(self, move, flips, evaluate=True):
+        self.history.append(self.snapshot())
+        changed = flips
+        if move is not None:
+            changed |= 1 << (move[0] * 12 + move[1])
+        self.side = "O" if self.side == "X" else "X"
+        self.player, self.opponent = self.opponent ^ flips, self.player | changed
+        if not evaluate:
+            self.evaluated = False
+        elif self.evaluated:
+            self.update(changed, flips)
+        else:
+            self.evaluate()
+
+    # takes back the last move played, given the same move and flips
+    def undo(self, move, flips):
+        played = self.opponent ^ flips
+        if move is not None:
+            played ^= 1 << (move[0] * 12 + move[1])
+        self.side = "O" if self.side == "X" else "X"
+        self.player, self.opponent = played, self.player ^ flips
+        self.restore(self.history.pop())
+
+    # (player, opponent) of the board after each of moves, from the view of the side moving next
+    def children(self, moves):
+        return [(self.opponent ^ flips, self.player | flips | 1 << (move[0] * 12 + move[1])) for move, flips in moves]
+
+    # (heuristic, isLeaf, snapshot()) of the board after each of moves, as if each was played and taken back in turn;
+    # the moves on all of those boards are found at once by find_moves_stacked(), unless given as found, the
+    # (moves, opponent moves) bitboards of each; the board must be evaluated
+    def score_children(self, moves, found=None):
+        side, player, opponent, parent = self.side, self.player, self.opponent, self.snapshot()
+        if found is None:
+            children = self.children(moves)
+            found = zip(find_moves_stacked(children), find_moves_stacked([(o, p) for p, o in children]))
+        scored = []
+        for (move, flips), (child_moves, child_omoves) in zip(moves, found):
+            changed = flips | 1 << (move[0] * 12 + move[1])
+            self.side = "O" if side == "X" else "X"
+            self.player, self.opponent = opponent ^ flips, player | changed
+            self.update_discs(changed, flips)
+            self.pmove_list = None
+            self.moves = child_moves
+            self.pmove_count = popcount(child_moves)
+            self.omoves = popcount(child_omoves)
+            self.heuristic, self.isLeaf = self.heuristics()
+            scored.append((self.heuristic, self.isLeaf, self.snapshot()))
+            self.restore(parent)
+        self.side, self.player, self.opponent = side, player, opponent
+        return scored
+
+    # everything derived from the discs, to be put back by restore() while the discs are the same again
+    def snapshot(self):
+        return (self.moves, self.pmove_list, self.pmove_count, self.omoves, self.pcount, self.ocount, self.pcenter,
+                self.ocenter, self.pgroup, self.ogroup, self.pgroups, self.ogroups, self.heuristic, self.isLeaf,
+                self.evaluated)
+
+    def restore(self, snapshot):
+        self.moves, self.pmove_list, self.pmove_count, self.omoves, self.pcount, self.ocount, \
+            self.pcenter, self.ocenter, self.pgroup, self.ogroup, self.pgroups, self.ogroups, self.heuristic, \
+            self.isLeaf, self.evaluated = snapshot
+
+    # counts over the whole board, only needed when there are no earlier counts to update
+    def scan_board(self):
+        self.pcount = popcount(self.player)
+        self.ocount = popcount(self.opponent)
+        self.pcenter = popcount(self.player & CENTER)
+        self.ocenter = popcount(self.opponent & CENTER)
+        self.pgroups = find_groups(self.player)
+        self.ogroups = find_groups(self.opponent)
+        self.pgroup = len(self.pgroups)
+        self.ogroup = len(self.ogroups)
+
+    def scan_moves(self):
+        self.pmove_list = None
+        self.moves = find_moves(self.player, self.opponent)
+        self.pmove_count = popcount(self.moves)
+        self.omoves = popcount(find_moves(self.opponent, self.player))
+
+    # player valid moves, format [(x,y), flips] i.e. move at (x,y) flips the discs set in bitboard flips
+    # flips are only worked out here since most boards are only scored, never expanded
+    @property
+    def pmoves(self):
+        if self.pmove_list is None:
+            self.pmove_list = []
+            moves = self.moves
+            while moves:
+                bit = moves & -moves
+                square = bit.bit_length() - 1
+                self.pmove_list.append([divmod(square, 12), self.check_move(square)])
+                moves ^= bit
+        return self.pmove_list
+
+    # discs flipped by a valid move at square (row * 12 + column)
+    def check_move(self, square):
+        return find_flips(self.player, self.opponent, square)
 
     # player corners - opponent corners
     def corner_heuristic(self):
-        result = 0
-        if self.state[0][0] != '.':
-            result += 1 if self.state[0][0] == self.side else -1
-        if self.state[0][11] != '.':
-            result += 1 if self.state[0][11] == self.side else -1
-        if self.state[11][0] != '.':
-            result += 1 if self.state[11][0] == self.side else -1
-        if self.state[11][11] != '.':
-            result += 1 if self.state[11][11] == self.side else -1
-        return result
+        return popcount(self.player & CORNERS) - popcount(self.opponent & CORNERS)
 
     # player's stable discs - opponent stable discs
     # def stability_heuristic(self):
@@ -130,8 +344,8 @@ class Board:
 
     # player's moves - opponent's moves
     def mobility_heuristic(self):
-        return (len(self.pmoves) - self.omoves) / (len(self.pmoves) + self.omoves) \
-            if len(self.pmoves) + self.omoves != 0 else 0
+        return (self.pmove_count - self.omoves) / (self.pmove_count + self.omoves) \
+            if self.pmove_count + self.omoves != 0 else 0
 
     # player's disc count - opponent's disc count, including tiebreaker
     def disc_heuristic(self):
@@ -148,7 +362,7 @@ class Board:
     # could add stability heuristic but harder to implement due to wedges etc.
     def heuristics(self):
         # game end condition
-        if len(self.pmoves) == 0 and self.omoves == 0:
+        if self.pmove_count == 0 and self.omoves == 0:
             return 1e9 if self.disc_heuristic() > 0 else -1e9, True
         elif self.pcount == 0:
             return -1e9, True
@@ -163,150 +377,168 @@ class Board:
                (self.e1 * tcount + self.e2) * self.group_heuristic(), False
 
 
-# holds state tree to perform alpha beta pruning, incomplete since it takes shortcuts (patience value) for optimization
-# alpha beta values ALWAYS from the perspective of the player
-class FutureState:
-    def __init__(self, b, d, p, pm, alpha, beta, heuristic):
-        self.board = b
-        self.depth = d
-        self.prev = p
-        # what move brought us here
-        self.prev_move = pm
-        self.next = []
-        self.alpha = alpha
-        self.beta = beta
-        # carry best value heuristic after search back to root
-        self.best_val = None
-        self.best_move = None
-        self.move_coord = None
-        # number of consecutive prunes before the rest of the nodes are abandoned entirely
-        # i.e. assumes the rest of the moves are bad, since original list of moves are ordered
-        self.patience = 3
-        self.heuristic = heuristic
-
-    # generates next layer of states, and orders them in order of most to least favorable (estimate)
-    # min-heap since HEURISTICS are INVERTED for opponent; i.e. best outcome for player is worst outcome for opponent
-    def generate_ply(self):
-        switch_sides = "O" if self.board.side == "X" else "X"
-        # no moves for current player, switch sides but do not decrement depth
-        if not self.board.pmoves and not self.board.isLeaf:
-            obj = FutureState(Board(self.heuristic, switch_sides, copy.deepcopy(self.board.state)),
-                              self.depth, self, None, self.alpha, self.beta, self.heuristic)
-            self.next = [(obj.board.heuristic, None, obj)]
+# scores the board if each move was played (all at once, see Board.score_children()); returns the moves as
+# (heuristic, move, flips, board values after the move) in the order to try them, best first by heuristic (INVERTED
+# since it is from the opponent's view)
+def score_moves(state, moves):
+    scored = []
+    for (move, flips), (heuristic, leaf, snapshot) in zip(moves, state.score_children(moves)):
+        scored.append((heuristic, move, flips, snapshot))
+    # optimization to order most (estimated) appealing moves first, before actually calculating their appeal
+    scored.sort(key=lambda child: child[0])
+    return scored
+
+
+# alpha beta search (negamax: every value is from the view of the side to move, so a child's value is negated)
+# of the shared board state, which is moved in and out of each position with play() and undo(); returns
+# (value, best move) searching depth plies ahead within (alpha, beta)
+# incomplete since it takes shortcuts (patience value) for optimization
+def negamax(state, depth, alpha, beta):
+    # no moves for current player, switch sides but do not decrement depth
+    if not state.moves:
+        state.play(None, 0)
+        value = state.heuristic if state.isLeaf else negamax(state, depth, -beta, -alpha)[0]
+        state.undo(None, 0)
+        return -value, None
+    best = None
+    best_move = None
+    if depth == 1:
+        # moves are not searched further, their heuristic is their value
+        for move, flips in state.pmoves:
+            state.play(move, flips)
+            value = -state.heuristic
+            state.undo(move, flips)
+            if best is None or value > best:
+                best, best_move = value, move
+                # opponent will never allow this position, no need to look further
+                if best >= beta:
+                    break
+        return best, best_move
+    # corners are tried without scoring anything, as they often settle the node on their own; the other moves are
+    # only scored once those have been searched
+    children = []
+    rest = []
+    for move, flips in state.pmoves:
+        if (1 << (move[0] * 12 + move[1])) & CORNERS:
+            children.append((None, move, flips, None))
         else:
-            # generate board if move was played
-            for moveset in self.board.pmoves:
-                move = moveset[0]
-                changes = moveset[1]
-                new_board = copy.deepcopy(self.board.state)
-                new_board[move[0]][move[1]] = self.board.side
-                for c in changes:
-                    new_board[c[0]][c[1]] = self.board.side
-                obj = FutureState(Board(self.heuristic, switch_sides, new_board), self.depth - 1, self, move,
-                                  self.alpha, self.beta, self.heuristic)
-                self.next.append((obj.board.heuristic, move, obj))
-        # optimization to order most (estimated) appealing moves first, before actually calculating their appeal
-        heapq.heapify(self.next)
-        self.best_move = self.next[0][2].board.state
-        if self.depth == 1:
-            self.next = [heapq.heappop(self.next)]
-            heapq.heapify(self.next)
-
-    # getter function for the less intuitive heap method, returns (heuristic_value, FutureState object)
-    # carries updated alpha beta values down to subsequent nodes
-    def get_next(self):
-        h, m, updated = heapq.heappop(self.next)
-        updated.alpha, updated.beta = self.alpha, self.beta
-        return h, updated
-
-
-# takes board object (carrying state, heuristic, and player information) and how much depth to search
+            rest.append((move, flips))
+    if not children:
+        children, rest = score_moves(state, rest), None
+    # number of consecutive prunes before the rest of the nodes are abandoned entirely
+    # i.e. assumes the rest of the moves are bad, since moves are ordered
+    patience = 3
+    searched = 0
+    # children grows with the scored moves once the corners are used up
+    for key, move, flips, scored in children:
+        if scored is None:
+            state.play(move, flips)
+        else:
+            # already scored to order it, so its board is put back as it was rather than evaluated again
+            state.play(move, flips, False)
+            state.restore(scored)
+        if state.isLeaf:
+            value = -state.heuristic
+        elif best is None:
+            value = -negamax(state, depth - 1, -beta, -alpha)[0]
+        else:
+            # principal variation search: only prove this move is no better than the best so far with a window of
+            # (nearly) no width, searching it fully only if it is better after all
+            value = -negamax(state, depth - 1, -alpha - NULL_WINDOW, -alpha)[0]
+            if alpha < value < beta:
+                value = -negamax(state, depth - 1, -beta, -alpha)[0]
+        state.undo(move, flips)
+        searched += 1
+        if best is None or value > best:
+            best = value
+        if best_move is None:
+            best_move = move
+        if value > alpha:
+            alpha = value
+            # found a better value, so reset patience
+            patience = 3
+            best_move = move
+            # opponent will never allow this position, no need to look further
+            if alpha >= beta:
+                break
+        else:
+            # bad value, maybe future values are worse?
+            patience -= 1
+            if not patience:
+                break
+        if rest and searched == len(children):
+            children += score_moves(state, rest)
+            rest = None
+    return best, best_move
+
+
+# takes board object (carrying state, heuristic, and player information) and how much depth to search; returns the
+# new state, the move and its value from the search (None if not searched)
 def alpha_beta_minimax(heuristic, state, ply_depth):
     # may save future computation time
     # remember = None
     # very low time, cannot think, or if only 1 move
     if not ply_depth or len(state.pmoves) == 1:
-        move, changes = state.pmoves[0]
-        state.state[move[0]][move[1]] = state.side
-        for c in changes:
-            state.state[c[0]][c[1]] = state.side
-        return state.state, state.pmoves[0][0]
+        move, flips = state.pmoves[0]
+        placed = state.player | flips | (1 << (move[0] * 12 + move[1]))
+        return to_state(state.side, placed, state.opponent ^ flips), move, None
     # alpha = -100000000 | beta = 100000000
-    root = FutureState(state, ply_depth * 2, None, None, -1e9, 1e9, heuristic)
-    curnode = (state.heuristic, root)
-    # recursion ineffective, (modified) dfs instead
-    while curnode[1]:
-        est_heuristic, curstate = curnode
-        # check suitable depth reached or end game state
-        if not curstate.depth or curstate.board.isLeaf:
-            # current node is player side -> parent node is opponent side (saves time on de-referencing)
-            if curstate.board.side == root.board.side:
-                curstate.prev.best_val = min(curstate.prev.best_val, est_heuristic) \
-                    if curstate.prev.best_val else est_heuristic
-                if curstate.prev.beta > est_heuristic:
-                    curstate.prev.beta = est_heuristic
-                    # found a better value, so reset patience
-                    curstate.prev.patience = 3
-                    curstate.prev.best_move = curstate.board.state
-                    curstate.prev.move_coord = curstate.prev_move
-                else:
-                    # bad value, maybe future values are worse?
-                    curstate.prev.patience -= 1
-            else:
-                curstate.prev.best_val = max(curstate.prev.best_val, -est_heuristic) \
-                    if curstate.prev.best_val else -est_heuristic
-                # negative since HEURISTICS are INVERTED for opponent, convert once to standardize for whole tree
-                if curstate.prev.alpha < -est_heuristic:
-                    curstate.prev.alpha = -est_heuristic
-                    # found a better value, so reset patience
-                    curstate.prev.patience = 3
-                    curstate.prev.best_move = curstate.board.state
-                    curstate.prev.move_coord = curstate.prev_move
-                else:
-                    # bad value, maybe future values are worse?
-                    curstate.prev.patience -= 1
-            # return to parent
-            curnode = (None, curstate.prev)
-        # no moves left to assess or ran out of patience or player cannot get better moves (if opponent plays optimally)
-        elif (not curstate.next and curstate.best_val) or not curstate.patience or curstate.alpha >= curstate.beta:
-            if curstate.prev:
-                if curstate.board.side == root.board.side:
-                    curstate.prev.best_val = min(curstate.prev.best_val,
-                                                 curstate.best_val) if curstate.prev.best_val else curstate.best_val
-                    if curstate.prev.beta > curstate.best_val:
-                        curstate.prev.beta = curstate.best_val
-                        # found a better value, so reset patience
-                        curstate.prev.patience = 3
-                        curstate.prev.best_move = curstate.board.state
-                        curstate.prev.move_coord = curstate.prev_move
-                    else:
-                        # bad value, maybe future values are worse?
-                        curstate.prev.patience -= 1
-                else:
-                    curstate.prev.best_val = max(curstate.prev.best_val,
-                                                 curstate.best_val) if curstate.prev.best_val else curstate.best_val
-                    if curstate.prev.alpha < curstate.best_val:
-                        curstate.prev.alpha = curstate.best_val
-                        # found a better value, so reset patience
-                        curstate.prev.patience = 3
-                        curstate.prev.best_move = curstate.board.state
-                        curstate.prev.move_coord = curstate.prev_move
-                    else:
-                        # bad value, maybe future values are worse?
-                        curstate.prev.patience -= 1
-            curnode = (None, curstate.prev)
-        else:
-            # fresh node, not leaf and has depth remaining, expand and traverse to next node
-            if not curstate.next:
-                curstate.generate_ply()
-            curnode = curstate.get_next()
-    return root.best_move, root.move_coord
+    value, move = negamax(state, ply_depth * 2, -1e9, 1e9)
+    flips = state.check_move(move[0] * 12 + move[1])
+    return to_state(state.side, state.player | flips | (1 << (move[0] * 12 + move[1])), state.opponent ^ flips), \
+        move, value
 
 
-# returns new board state and True if move was made, False if no moves can be made
+# returns new board state and True if move was made, False if no moves can be made, along with the move and its
+# value from the search (see alpha_beta_minimax())
 def main(heuristic, player, state):
-    board = Board(heuristic, player, state)
-    if not board.pmoves:
-        return state, None, False
-    move, coords = alpha_beta_minimax(heuristic, board, 3)
-    return move, coords, True
+    board = Board(heuristic, player, *to_bitboards(player, state))
+    if not board.moves:
+        return state, None, False, None
+    move, coords, value = alpha_beta_minimax(heuristic, board, 3)
+    return move, coords, True, value
+
+
+# plays out games [(bot1, bot2), ...] (heuristics as in main(), bot1 playing O) all at once, every move the one its
+# mover's heuristic likes best a single move ahead rather than searched as main() does; each step moves every game
+# still going, with the moves after every move of all of them found in one stacked pass (see find_moves_stacked()),
+# so many games cost little more each than one; games start from the start position, or from openings, a (side to
+# move, O discs, X discs) for each game; positions, if given, gets (game, side, player, opponent, move, value) of every
+# position a move is chosen in, value being the chosen move's heuristic from the view of side; returns each game's
+# disc difference as trainer.startmatch() does, O - X with X's tiebreaker point
+def play_games(games, openings=None, positions=None):
+    boards = []
+    for i, (bot1, bot2) in enumerate(games):
+        side, o, x = openings[i] if openings else ("O", START_O, START_X)
+        boards.append(Board(bot1, side, *((o, x) if side == "O" else (x, o))))
+    playing = [i for i in range(len(games)) if not boards[i].isLeaf]
+    while playing:
+        movers = [i for i in playing if boards[i].moves]
+        children = [child for i in movers for child in boards[i].children(boards[i].pmoves)]
+        found = zip(find_moves_stacked(children), find_moves_stacked([(o, p) for p, o in children]))
+        for i in playing:
+            board = boards[i]
+            if not board.moves:
+                board.play(None, 0)
+                continue
+            side, player, opponent = board.side, board.player, board.opponent
+            board.set_heuristic(games[i][0] if board.side == "O" else games[i][1])
+            best = None
+            for (move, flips), (heuristic, leaf, snapshot) in zip(board.pmoves, board.score_children(
+                    board.pmoves, [next(found) for _ in board.pmoves])):
+                if best is None or heuristic < best[0]:
+                    best = heuristic, move, flips, snapshot
+            heuristic, move, flips, snapshot = best
+            if positions is not None:
+                positions.append((i, side, player, opponent, move, -heuristic))
+            # already scored, so the board is put back as it was rather than evaluated again
+            board.play(move, flips, False)
+            board.restore(snapshot)
+            # nothing is ever taken back
+            board.history = []
+        playing = [i for i in playing if not boards[i].isLeaf]
+    margins = []
+    for board in boards:
+        o, x = (board.player, board.opponent) if board.side == "O" else (board.opponent, board.player)
+        margins.append(popcount(o) - popcount(x) - 1)
+    return margins
@@ -1,297 +1,139 @@
-# calibrate benchmarks computing power to aid the main bot in deciding how deep it needs to search
+# calibrate benchmarks computing power, timing how long a fixed depth search of homework.py takes and how many nodes
+# it searches
+# python calibrate.py smp times homework.py's lazy SMP search with 1 to 16 processes instead
+# python calibrate.py bench [depth] [runs] benchmarks homework.py's and bot.py's searches over a fixed suite of
+# positions instead, written to benchmark.json
 
-import copy
-import heapq
-from collections import deque
 import time
-
-
-class Board:
-    def __init__(self, side, state):
-        self.side = side
-        self.state = state
-        # player valid moves, format [(x,y), [(x1,y1),(x2,y2)...]] i.e. move at (x,y) flips discs (x1,y1)...
-        self.pmoves = []
-        # opponent valid moves
-        self.omoves = 0
-        # player disc count
-        self.pcount = 0
-        # opponent disc count
-        self.ocount = 0
-        # player center disc count
-        self.pcenter = 0
-        # opponent center disc count
-        self.ocenter = 0
-        # player groups
-        self.pgroup = 0
-        # opponent groups
-        self.ogroup = 0
-        self.scan_board()
-        self.heuristic, self.isLeaf = self.heuristics()
-
-    def scan_board(self):
-        visited = [[0 for _ in range(12)] for _ in range(12)]
-        for i in range(12):
-            for j in range(12):
-                if visited[i][j]:
-                    continue
-                if self.state[i][j] == '.':
-                    self.check_move(i, j)
-                    visited[i][j] = 1
-                else:
-                    count, center = self.count_group(self.state[i][j], i, j, visited)
-                    if self.state[i][j] == self.side:
-                        self.pcount += count
-                        self.pcenter += center
-                        self.pgroup += 1
-                    else:
-                        self.ocount += count
-                        self.ocenter += center
-                        self.ogroup += 1
-
-    # checks if valid move
-    def check_move(self, startx, starty):
-        # transformations to the 8 surrounding tiles
-        dx = [-1, 0, 1, -1, 1, -1, 0, 1]
-        dy = [1, 1, 1, 0, 0, -1, -1, -1]
-        # flag to avoid duplicate counting of opponent's moves
-        flag = 0
-        for i in range(8):
-            curx = startx + dx[i]
-            cury = starty + dy[i]
-            side = '.'
-            while 0 <= curx < 12 and 0 <= cury < 12:
-                # hits empty tile, either right away or after a line of only 1 color, invalid move
-                if self.state[curx][cury] == '.':
-                    break
-                # hits occupied tile the first time
-                elif side == '.':
-                    side = self.state[curx][cury]
-                    # opponent move already counted in previous iteration
-                    if flag and self.side == side:
-                        break
-                # hits occupied tile that does not match the first tile hit (else move on)
-                elif self.state[curx][cury] != side:
-                    # valid move for opponent
-                    if self.side == side:
-                        self.omoves += 1
-                        flag = 1
-                    # valid move for player, calculate affected discs if this move was made
-                    else:
-                        # new move (flag equivalent to avoid duplicate counting of player's moves)
-                        if not self.pmoves or self.pmoves[-1][0] != (startx, starty):
-                            self.pmoves.append([(startx, starty), []])
-                        while curx - dx[i] != startx or cury - dy[i] != starty:
-                            self.pmoves[-1][1].append((curx - dx[i], cury - dy[i]))
-                            curx -= dx[i]
-                            cury -= dy[i]
-                    break
-                curx += dx[i]
-                cury += dy[i]
-
-    # bfs to scan complete group
-    def count_group(self, side, startx, starty, visited):
-        dx = [-1, 0, 1, -1, 1, -1, 0, 1]
-        dy = [1, 1, 1, 0, 0, -1, -1, -1]
-        queue = deque([(startx, starty)])
-        count = 0
-        center = 0
-        visited[startx][starty] = 1
-        while queue:
-            curx, cury = queue.popleft()
-            count += 1
-            if 1 < curx < 10 and 1 < cury < 10:
-                center += 1
-            for i in range(8):
-                if 0 <= curx + dx[i] < 12 and 0 <= cury + dy[i] < 12 and \
-                        not visited[curx + dx[i]][cury + dy[i]] and self.state[curx + dx[i]][cury + dy[i]] == side:
-                    queue.append((curx + dx[i], cury + dy[i]))
-                    visited[curx + dx[i]][cury + dy[i]] = 1
-        return count, center
-
-    # player corners - opponent corners
-    def corner_heuristic(self):
-        result = 0
-        if self.state[0][0] != '.':
-            result += 1 if self.state[0][0] == self.side else -1
-        if self.state[0][11] != '.':
-            result += 1 if self.state[0][11] == self.side else -1
-        if self.state[11][0] != '.':
-            result += 1 if self.state[11][0] == self.side else -1
-        if self.state[11][11] != '.':
-            result += 1 if self.state[11][11] == self.side else -1
-        return result
-
-    # player's stable discs - opponent stable discs
-    # def stability_heuristic(self):
-    #     return 0
-
-    # player's moves - opponent's moves
-    def mobility_heuristic(self):
-        return (len(self.pmoves) - self.omoves) / (len(self.pmoves) + self.omoves) \
-            if len(self.pmoves) + self.omoves != 0 else 0
-
-    # player's disc count - opponent's disc count, including tiebreaker
-    def disc_heuristic(self):
-        return (self.pcount - self.ocount + (1 if self.side == 'X' else -1)) / (self.pcount + self.ocount)
-
-    # player's disc count in central 64 tiles - opponent's disc count in central 64 tiles
-    def center_control_heuristic(self):
-        return (self.pcenter - self.ocenter) / (self.pcenter + self.ocenter)
-
-    # player's separated groups (including diagonals) - opponent's separated groups
-    def group_heuristic(self):
-        return (max(self.pgroup, 2) - max(self.ogroup, 2)) / (max(self.pgroup, 2) + max(self.ogroup, 2))
-
-    # could add stability heuristic but harder to implement due to wedges etc.
-    def heuristics(self):
-        # game end condition
-        if len(self.pmoves) == 0 and self.omoves == 0:
-            return (1e6 if self.disc_heuristic() > 0 else -1e6), True
-        elif self.pcount == 0:
-            return -1e6, True
-        elif self.ocount == 0:
-            return 1e6, True
-        # metric to measure early/mid/late game by how many discs on the board, as a cubic function
-        tcount = self.pcount + self.ocount
-        return (0.185 * tcount + 55.6) * self.corner_heuristic() + \
-               (0.75 * tcount + 25) * self.mobility_heuristic() + \
-               (0.04 * tcount + 9.1) * self.disc_heuristic() + \
-               (-0.55 * tcount - 15) * self.center_control_heuristic() + \
-               (-0.68 * tcount - 13.6) * self.group_heuristic(), False
-
-
-# holds state tree to perform alpha beta pruning, incomplete since it takes shortcuts (patience value) for optimization
-# alpha beta values ALWAYS from the perspective of the player
-class FutureState:
-    def __init__(self, b, d, p, pm, alpha, beta):
-        self.board = b
-        self.depth = d
-        self.prev = p
-        # what move brought us here
-        self.prev_move = pm
-        self.next = []
-        self.alpha = alpha
-        self.beta = beta
-        # carry best value heuristic after search back to root
-        self.best_val = None
-        self.best_move = None
-        # number of consecutive prunes before the rest of the nodes are abandoned entirely
-        # i.e. assumes the rest of the moves are bad, since original list of moves are ordered
-        self.patience = 3
-
-    # generates next layer of states, and orders them in order of most to least favorable (estimate)
-    # min-heap since HEURISTICS are INVERTED for opponent; i.e. best outcome for player is worst outcome for opponent
-    def generate_ply(self):
-        switch_sides = "O" if self.board.side == "X" else "X"
-        # no moves for current player, switch sides but do not decrement depth
-        if not self.board.pmoves and not self.board.isLeaf:
-            obj = FutureState(Board(switch_sides, copy.deepcopy(self.board.state)),
-                              self.depth, self, None, self.alpha, self.beta)
-            self.next = [(obj.board.heuristic, None, obj)]
-        else:
-            # generate board if move was played
-            for moveset in self.board.pmoves:
-                move = moveset[0]
-                changes = moveset[1]
-                new_board = copy.deepcopy(self.board.state)
-                new_board[move[0]][move[1]] = self.board.side
-                for c in changes:
-                    new_board[c[0]][c[1]] = self.board.side
-                obj = FutureState(Board(switch_sides, new_board), self.depth - 1, self, move, self.alpha, self.beta)
-                self.next.append((obj.board.heuristic, move, obj))
-        # optimization to order most (estimated) appealing moves first, before actually calculating their appeal
-        heapq.heapify(self.next)
-        self.best_move = self.next[0][1]
-        if self.depth == 1:
-            self.next = [heapq.heappop(self.next)]
-            heapq.heapify(self.next)
-
-    # getter function for the less intuitive heap method, returns (heuristic_value, FutureState object)
-    # carries updated alpha beta values down to subsequent nodes
-    def get_next(self):
-        h, m, updated = heapq.heappop(self.next)
-        updated.alpha, updated.beta = self.alpha, self.beta
-        return h, updated
-
-
-# takes board object (carrying state, heuristic, and player information) and how much depth to search
-def alpha_beta_minimax(state, ply_depth):
-    # may save future computation time
-    # remember = None
-    # very low time, cannot think, or if only 1 move
-    if not ply_depth or len(state.pmoves) == 1:
-        return state.pmoves[0][0]  # , remember
-    # alpha = -100000000 | beta = 100000000
-    root = FutureState(state, ply_depth * 2, None, None, -1e9, 1e9)
-    curnode = (state.heuristic, root)
-    expanded = 0
-    # recursion ineffective, (modified) dfs instead
-    while curnode[1]:
-        est_heuristic, curstate = curnode
-        # check suitable depth reached or end game state
-        if not curstate.depth or curstate.board.isLeaf:
-            # current node is player side -> parent node is opponent side (saves time on de-referencing)
-            if curstate.board.side == root.board.side:
-                curstate.prev.best_val = min(curstate.prev.best_val, est_heuristic) \
-                    if curstate.prev.best_val else est_heuristic
-                if curstate.prev.beta > est_heuristic:
-                    curstate.prev.beta = est_heuristic
-                    # found a better value, so reset patience
-                    curstate.prev.patience = 3
-                    curstate.prev.best_move = curstate.prev_move
-                else:
-                    # bad value, maybe future values are worse?
-                    curstate.prev.patience -= 1
-            else:
-                curstate.prev.best_val = max(curstate.prev.best_val, -est_heuristic) \
-                    if curstate.prev.best_val else -est_heuristic
-                # negative since HEURISTICS are INVERTED for opponent, convert once to standardize for whole tree
-                if curstate.prev.alpha < -est_heuristic:
-                    curstate.prev.alpha = -est_heuristic
-                    # found a better value, so reset patience
-                    curstate.prev.patience = 3
-                    curstate.prev.best_move = curstate.prev_move
-                else:
-                    # bad value, maybe future values are worse?
-                    curstate.prev.patience -= 1
-            # return to parent
-            curnode = (None, curstate.prev)
-        # no moves left to assess or ran out of patience or player cannot get better moves (if opponent plays optimally)
-        elif (not curstate.next and curstate.best_val) or not curstate.patience or curstate.alpha >= curstate.beta:
-            if curstate.prev:
-                if curstate.board.side == root.board.side:
-                    curstate.prev.best_val = min(curstate.prev.best_val,
-                                                 curstate.best_val) if curstate.prev.best_val else curstate.best_val
-                    if curstate.prev.beta > curstate.best_val:
-                        curstate.prev.beta = curstate.best_val
-                        # found a better value, so reset patience
-                        curstate.prev.patience = 3
-                        curstate.prev.best_move = curstate.prev_move
-                    else:
-                        # bad value, maybe future values are worse?
-                        curstate.prev.patience -= 1
-                else:
-                    curstate.prev.best_val = max(curstate.prev.best_val,
-                                                 curstate.best_val) if curstate.prev.best_val else curstate.best_val
-                    if curstate.prev.alpha < curstate.best_val:
-                        curstate.prev.alpha = curstate.best_val
-                        # found a better value, so reset patience
-                        curstate.prev.patience = 3
-                        curstate.prev.best_move = curstate.prev_move
-                    else:
-                        # bad value, maybe future values are worse?
-                        curstate.prev.patience -= 1
-            curnode = (None, curstate.prev)
+import sys
+import json
+import math
+import statistics
+import homework
+import bot
+
+# benchmark suite: (name, side to move, rows) of positions from the opening, middle and end of the game (random play
+# from the start position), searched by homework.py and bot.py alike
+BENCH_POSITIONS = (
+    ("opening-1", "X", ("............", "............", "..XO........", "..OO........",
+                        "...O........", "............", "............", ".......XO...",
+                        ".......XOO..", ".......XXO..", ".......XX.O.", ".......X....")),
+    ("opening-2", "O", ("............", "...X........", ".OOX........", "..OOO.......",
+                        ".........OX.", ".........X.O", "........XOO.", ".........O..",
+                        ".......OOOX.", ".......OOX.X", ".......O....", "............")),
+    ("midgame-1", "X", ("............", "............", ".OOO..OX....", "..OO...OX...",
+                        "....O.OXXXXX", ".....O.XXOX.", "......OXXXOO", "...OOOOOOXO.",
+                        ".....X.OXXOX", "......OXOXXX", ".....OOOOOO.", ".....XXX.OOX")),
+    ("midgame-2", "O", ("XXXOOOOOO...", "XXO.OOO.....", "XOXXXXXX....", "OXXOOXXO....",
+                        "OOXXXXOO....", "OOOXXX...O.X", "......XO.OO.", ".......OXO.O",
+                        "......OXXOOO", ".....OXOOO.O", ".....X.O.OXO", "......XXXXXX")),
+    ("endgame-1", "X", (".........O.O", "..OX..O.OOOO", "OOOX.O.O.OOO", ".OOX.OOOOOOO",
+                        "..OOOOOOOOXO", "XOOXOXOOOXOO", "XXOX.OXOOOXO", "XXOOXOXO.OOO",
+                        "XXOXXXOOOOOO", "XX.OOOXOXOOO", "XXXOOOOOOOOO", "XXXOOOOOOOOO")),
+    ("endgame-2", "O", ("O..XX.XXXXXX", "OOOXXXOOXXXO", "OOXXXOOXOXO.", "OOXOOOXOOXOX",
+                        "XOOOOOOXOXOX", "XOOOXOOOXXOO", "XXOXOOOOXXO.", "XXOXXOXXXXXO",
+                        "O.XXOOOOXOXO", "...OXXOXXXOO", "XXOXXXXXXXXO", ".O..OOOOOOOX")))
+# moves searched ahead (2 plies each), untimed runs to warm up and timed runs of each position, and the report file
+BENCH_DEPTH = 3
+BENCH_WARMUP = 1
+BENCH_RUNS = 5
+BENCH_FILE = "benchmark.json"
+# heuristic of homework.py, for bot.py's search
+BENCH_HEURISTIC = [0.185, 55.6, 0.75, 25, 0.04, 9.1, -0.55, -15, -0.68, -13.6]
+
+
+# times homework.py's lazy SMP search to depth with 1 to 16 processes, from the position player, prompt
+def smp_scaling(player, prompt, depth):
+    single = None
+    for workers in (1, 2, 4, 8, 16):
+        board = homework.Board(player, *homework.to_bitboards(player, prompt))
+        start = time.time()
+        move, reached = homework.lazy_smp_search(board, time.monotonic() + 1e6, workers, depth)
+        elapsed = time.time() - start
+        if single is None:
+            single = elapsed
+        # processes, move found, seconds taken, and speedup over 1 process
+        print(workers, move, round(elapsed, 3), round(single / elapsed, 2))
+
+
+# Board of module counting the positions evaluated on it, i.e. the nodes searched from it; counted the same way by
+# both engines, although homework.py evaluates the children of a position together without playing them
+def counting_board(module):
+    class CountingBoard(module.Board):
+        nodes = 0
+
+        def heuristics(self):
+            self.nodes += 1
+            return super().heuristics()
+
+    return CountingBoard
+
+
+# searches the position side, rows with engine ("homework" or "bot") 1 to depth moves ahead as iterative deepening
+# does: homework keeps its transposition table and move ordering from one depth to the next, bot (having neither)
+# searches each depth afresh; returns (move, nodes, seconds, table hit rate or None) of each depth
+def bench_search(engine, side, rows, depth):
+    state = [list(row) for row in rows]
+    board = table = stats = order = None
+    if engine == "homework":
+        board = counting_board(homework)(side, *homework.to_bitboards(side, state))
+        table, stats, order = homework.TranspositionTable(), homework.SearchStats(), homework.MoveOrdering()
+    searches = []
+    for ply_depth in range(1, depth + 1):
+        if engine == "homework":
+            nodes = board.nodes
+            probes = table.hits, table.misses
+            start = time.perf_counter()
+            move = homework.alpha_beta_minimax(board, ply_depth, math.inf, table, stats, order)
+            elapsed = time.perf_counter() - start
+            hits, misses = table.hits - probes[0], table.misses - probes[1]
+            searches.append((move, board.nodes - nodes, elapsed, hits / max(hits + misses, 1)))
         else:
-            # fresh node, not leaf and has depth remaining, expand and traverse to next node
-            if not curstate.next:
-                curstate.generate_ply()
-            curnode = curstate.get_next()
-            expanded += 1
-    return root.best_move, expanded
-
-
+            board = counting_board(bot)(BENCH_HEURISTIC, side, *bot.to_bitboards(side, state))
+            start = time.perf_counter()
+            move = bot.alpha_beta_minimax(BENCH_HEURISTIC, board, ply_depth)[1]
+            searches.append((move, board.nodes, time.perf_counter() - start, None))
+    return searches
+
+
+# report of both engines on every position of BENCH_POSITIONS: after warmup untimed runs, each position is searched
+# runs times and its times are the median of the runs (nodes and moves are the same every run); each depth has its
+# move, nodes, seconds to finish it and to reach it from the start (time to depth), nodes per second, transposition
+# table hit rate and effective branching factor (the nodes of each ply over the ply before)
+def benchmark(depth=BENCH_DEPTH, runs=BENCH_RUNS, warmup=BENCH_WARMUP):
+    report = {"depth": depth, "runs": runs, "warmup": warmup, "positions": [], "totals": {}}
+    for engine in ("homework", "bot"):
+        report["totals"][engine] = {"nodes": 0, "seconds": 0}
+    for name, side, rows in BENCH_POSITIONS:
+        position = {"name": name, "side": side, "engines": {}}
+        for engine in ("homework", "bot"):
+            for _ in range(warmup):
+                bench_search(engine, side, rows, depth)
+            timed = [bench_search(engine, side, rows, depth) for _ in range(runs)]
+            depths = []
+            reached = 0
+            for i, (move, nodes, elapsed, hit_rate) in enumerate(timed[0]):
+                seconds = statistics.median(searches[i][2] for searches in timed)
+                reached += seconds
+                branching = (nodes / depths[-1]["nodes"]) ** 0.5 if depths and depths[-1]["nodes"] else None
+                depths.append({"depth": i + 1, "move": move, "nodes": nodes, "seconds": seconds,
+                               "time_to_depth": reached, "nodes_per_second": nodes / seconds,
+                               "table_hit_rate": hit_rate, "branching": branching})
+            last = depths[-1]
+            position["engines"][engine] = {"move": last["move"], "nodes": sum(d["nodes"] for d in depths),
+                                           "seconds": reached, "depths": depths}
+            report["totals"][engine]["nodes"] += position["engines"][engine]["nodes"]
+            report["totals"][engine]["seconds"] += reached
+            # position, engine, move chosen, nodes searched, seconds taken and nodes per second
+            print(name, engine, last["move"], position["engines"][engine]["nodes"], round(reached, 3),
+                  round(position["engines"][engine]["nodes"] / reached))
+        report["positions"].append(position)
+    for totals in report["totals"].values():
+        totals["nodes_per_second"] = totals["nodes"] / totals["seconds"]
+    return report
+
+
+# "python calibrate.py smp" times lazy SMP instead, "python calibrate.py bench" runs the benchmark suite
 def main():
     player = "O"
     prompt = [list("............"),
@@ -306,16 +148,20 @@ def main():
               list("........OX.."),
               list("............"),
               list("............")]
-    board = Board(player, prompt)
-    # times how long and how many nodes expanded each depth search takes
-    start = time.time()
-    # calculate time per node
-    move, expanded = alpha_beta_minimax(board, 3)
-    print(move)
-    time_per_node = time.time() - start
-    outfile = open("calibrate.txt", "w")
-    outfile.write(str(time_per_node) + " " + str(expanded))
-    outfile.close()
+    if len(sys.argv) > 1 and sys.argv[1] == "smp":
+        smp_scaling(player, prompt, 4)
+        return
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        report = benchmark(*map(int, sys.argv[2:4]))
+        with open(BENCH_FILE, "w") as file:
+            json.dump(report, file, indent=1)
+        return
+    board = counting_board(homework)(player, *homework.to_bitboards(player, prompt))
+    start = time.perf_counter()
+    move = homework.alpha_beta_minimax(board, BENCH_DEPTH, math.inf)
+    elapsed = time.perf_counter() - start
+    # move found, nodes searched, seconds taken and nodes per second
+    print(move, board.nodes, round(elapsed, 3), round(board.nodes / elapsed))
 
 
 if __name__ == '__main__':
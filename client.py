@@ -0,0 +1,30 @@
+# Sends input.txt to a running homework.py server (started with "python homework.py serve homework.sock") and writes
+# its move to output.txt, the same as running homework.py itself but without starting a new search engine every move
+# Instructions: run client.py with the server running, input.txt in the same format as for homework.py
+
+import socket
+
+# where the server listens
+SOCKET_PATH = "homework.sock"
+
+
+def main():
+    file = open("input.txt", "r")
+    # X or O
+    player = file.readline().rstrip()
+    time_left = file.readline().split()[0]
+    # 12x12 board layout, sent as 144 tiles on one line
+    tiles = "".join(file.readline().rstrip() for _ in range(12))
+    file.close()
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(SOCKET_PATH)
+    client.sendall(f"{player} {time_left} {tiles}\n".encode())
+    move = client.makefile().readline().rstrip()
+    client.close()
+    outfile = open("output.txt", "w")
+    outfile.write(move)
+    outfile.close()
+
+
+if __name__ == '__main__':
+    main()
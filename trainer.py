@@ -5,15 +5,53 @@
 # CPU intensive program! TRAIN AT YOUR OWN RISK!
 
 import multiprocessing
+import array
+import queue
 import random
+import math
+import struct
+import mmap
 import bot
+import homework
 import datetime
+import os
+
+# a batched pairing is decided by a sequential probability ratio test (SPRT) of bot1 being ELO_MARGIN Elo stronger
+# than bot2 against ELO_MARGIN weaker, wrong either way at most SPRT_ERROR of the time
+ELO_MARGIN = 20
+SPRT_ERROR = 0.05
+# openings each undecided pairing plays (once with each bot first) between tests, and most games a pairing plays
+# before the test gives up and the better score wins
+SPRT_OPENINGS = 4
+SPRT_GAMES = 400
+# moves played from the start position to make an opening, following the opening book while it has the position
+OPENING_PLIES = 6
+# self-play games recorded for the weights to be fitted to, and most moves into the game their openings go
+FIT_GAMES = 4000
+FIT_OPENING_PLIES = 24
+# games bot.play_games() plays at once when fitting; stacking thousands of boards into one int costs more than it saves
+FIT_BATCH = 200
+# passes over the positions of those games when fitting, and how far each position moves the weights towards it
+FIT_EPOCHS = 6
+FIT_RATE = 0.003
+# self-play position database: each record is a position a move was played in, as the discs of the side to move and
+# of its opponent (144 bits each), that side (0 for O, 1 for X), the square played, the move's value from the search
+# or heuristic that chose it (NaN if none did) and the game's final disc difference, both from the view of that side
+POSITION_FILE = "positions.bin"
+POSITION_RECORD = struct.Struct("<18s18sBBfh")
+# records read at a time when streaming the database
+POSITION_CHUNK = 1 << 12
 
 
 # returns the bot that won; if tied, the one that won 'harder' (more disc difference)
 def match(bot1, bot2, visuals):
-    one_side = startmatch(bot1, bot2, visuals, False)
-    other_side = startmatch(bot2, bot1, visuals, False)
+    one_side, _ = startmatch(bot1, bot2, visuals, False)
+    other_side, _ = startmatch(bot2, bot1, visuals, False)
+    return winner(bot1, bot2, one_side, other_side)
+
+
+# the bot that won given the disc difference of a game each way round, bot1 going first in one_side
+def winner(bot1, bot2, one_side, other_side):
     if one_side > 0 > other_side:
         w = bot1
     elif one_side < 0 < other_side:
@@ -23,6 +61,204 @@ def match(bot1, bot2, visuals):
     return w
 
 
+# (side to move, O discs, X discs) after plies moves from the start position, each a move of the opening book picked
+# by how often it was played, or a random move once the position is not in the book
+def opening(plies=OPENING_PLIES):
+    board = bot.Board([0] * 10, "O", bot.START_O, bot.START_X)
+    for _ in range(plies):
+        if board.isLeaf:
+            break
+        booked = [(move, total) for wins, total, move in homework.read_book(board.side, board.player, board.opponent)
+                  if move is None or board.moves >> (move[0] * 12 + move[1]) & 1]
+        if booked:
+            move = random.choices([move for move, total in booked], [total for move, total in booked])[0]
+        else:
+            move = random.choice(board.pmoves)[0] if board.moves else None
+        board.play(move, board.check_move(move[0] * 12 + move[1]) if move else 0)
+    o, x = (board.player, board.opponent) if board.side == "O" else (board.opponent, board.player)
+    return board.side, o, x
+
+
+# a position of the database (side, player, opponent, square, value, margin) to its record and back
+def pack_position(side, player, opponent, square, value, margin):
+    return POSITION_RECORD.pack(player.to_bytes(18, "little"), opponent.to_bytes(18, "little"),
+                                0 if side == "O" else 1, square, math.nan if value is None else value, margin)
+
+
+def unpack_position(player, opponent, side, square, value, margin):
+    return "O" if side == 0 else "X", int.from_bytes(player, "little"), int.from_bytes(opponent, "little"), square, \
+        value, margin
+
+
+# appends the positions of a game, (side, player, opponent, square, value) each, to the database at path in one write,
+# so a crash loses at most the game being written; margin is the game's final disc difference, O - X
+def append_positions(positions, margin, path=POSITION_FILE):
+    with open(path, "ab") as file:
+        file.write(b"".join(pack_position(side, player, opponent, square, value, margin if side == "O" else -margin)
+                            for side, player, opponent, square, value in positions))
+
+
+# every (side, player, opponent, square, value, margin) in the database at path, a chunk at a time, so the database
+# need never fit in memory; a record cut short by a crash while appending is left out
+def iter_positions(path=POSITION_FILE):
+    with open(path, "rb") as file:
+        while True:
+            chunk = file.read(POSITION_RECORD.size * POSITION_CHUNK)
+            for record in POSITION_RECORD.iter_unpack(chunk[:len(chunk) - len(chunk) % POSITION_RECORD.size]):
+                yield unpack_position(*record)
+            if len(chunk) < POSITION_RECORD.size * POSITION_CHUNK:
+                return
+
+
+# records in the database at path, and the ones at indices read from the file mapped into memory, so a sample of a
+# large database reads only the pages it is on
+def count_positions(path=POSITION_FILE):
+    return os.path.getsize(path) // POSITION_RECORD.size
+
+
+def read_positions(indices, path=POSITION_FILE):
+    with open(path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return [unpack_position(*POSITION_RECORD.unpack_from(mapped, i * POSITION_RECORD.size)) for i in indices]
+
+
+# records every position of FIT_GAMES games heuristic plays against itself (bot.play_games()) from openings of up to
+# FIT_OPENING_PLIES moves in the database at path, FIT_BATCH games at a time
+def self_play(heuristic, path=POSITION_FILE):
+    for _ in range(FIT_GAMES // FIT_BATCH):
+        openings = [opening(random.randint(2, FIT_OPENING_PLIES)) for _ in range(FIT_BATCH)]
+        played = []
+        margins = bot.play_games([(heuristic, heuristic)] * FIT_BATCH, openings, played)
+        games = [[] for _ in range(FIT_BATCH)]
+        for game, side, player, opponent, move, value in played:
+            games[game].append((side, player, opponent, move[0] * 12 + move[1], value))
+        for positions, margin in zip(games, margins):
+            append_positions(positions, margin, path)
+
+
+# fits the weights of homework.pattern_value() to the final disc difference of positions (as iter_positions()) by
+# stochastic gradient descent on the squared error of every position, and writes them to homework.PATTERN_FILE;
+# returns the mean squared error of the last pass
+def fit_patterns(positions):
+    samples = []
+    for side, player, opponent, square, value, margin in positions:
+        base = homework.pattern_stage(bot.popcount(player | opponent)) * homework.PATTERN_WEIGHTS
+        samples.append((base, homework.pattern_indices(player, opponent), margin))
+    weights = [0.0] * (homework.PATTERN_WEIGHTS * homework.PATTERN_STAGES)
+    error = 0
+    for _ in range(FIT_EPOCHS):
+        random.shuffle(samples)
+        error = 0
+        for base, indices, margin in samples:
+            miss = margin - sum(weights[base + i] for i in indices)
+            error += miss * miss
+            for i in indices:
+                weights[base + i] += miss * FIT_RATE
+    with open(homework.PATTERN_FILE, "wb") as file:
+        array.array("f", weights).tofile(file)
+    return error / len(samples)
+
+
+# x solving matrix x = vector, by Gaussian elimination
+def solve(matrix, vector):
+    rows = [row[:] + [value] for row, value in zip(matrix, vector)]
+    for i in range(len(rows)):
+        pivot = max(range(i, len(rows)), key=lambda j: abs(rows[j][i]))
+        rows[i], rows[pivot] = rows[pivot], rows[i]
+        for j in range(len(rows)):
+            if j != i:
+                ratio = rows[j][i] / rows[i][i]
+                rows[j] = [a - ratio * b for a, b in zip(rows[j], rows[i])]
+    return [row[-1] / row[i] for i, row in enumerate(rows)]
+
+
+# the 10 heuristic values best predicting the final disc difference of positions (as iter_positions()), by least
+# squares; each pair of values weighs its quality (as bot.Board.heuristics()) times the discs on the board, and the
+# quality itself, so the heuristic is linear in all 10 and they solve the normal equations; rounded as the genetic
+# algorithm does
+def fit_heuristic(positions):
+    products = [[0] * 10 for _ in range(10)]
+    targets = [0] * 10
+    for side, player, opponent, square, value, margin in positions:
+        board = bot.Board([0] * 10, side, player, opponent)
+        if board.isLeaf:
+            continue
+        tcount = board.pcount + board.ocount
+        features = []
+        for quality in (board.corner_heuristic(), board.mobility_heuristic(), board.disc_heuristic(),
+                        board.center_heuristic(), board.group_heuristic()):
+            features += [quality * tcount, quality]
+        for i in range(10):
+            targets[i] += features[i] * margin
+            for j in range(10):
+                products[i][j] += features[i] * features[j]
+    return [round(value, 3 if i % 2 == 0 else 1) for i, value in enumerate(solve(products, targets))]
+
+
+# expected score (win 1, draw 1/2) of a bot elo Elo stronger than its opponent, and the Elo of an expected score
+def expected_score(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def elo(score):
+    score = min(max(score, 1e-3), 1 - 1e-3)
+    return -400 * math.log10(1 / score - 1)
+
+
+# mean and variance of game scores
+def score_stats(scores):
+    mean = sum(scores) / len(scores)
+    return mean, sum((score - mean) ** 2 for score in scores) / len(scores)
+
+
+# (Elo, low, high) of a bot from its game scores, the true Elo within (low, high) 95% of the time
+def elo_interval(scores):
+    mean, variance = score_stats(scores)
+    spread = 1.96 * math.sqrt(variance / len(scores))
+    return elo(mean), elo(mean - spread), elo(mean + spread)
+
+
+# log likelihood ratio of the SPRT given bot1's game scores (normal approximation), positive if bot1 looks stronger
+def sprt_llr(scores):
+    mean, variance = score_stats(scores)
+    low, high = expected_score(-ELO_MARGIN), expected_score(ELO_MARGIN)
+    if not variance:
+        return math.copysign(math.inf, mean - 0.5) if mean != 0.5 else 0
+    return len(scores) * (high - low) * (2 * mean - low - high) / (2 * variance)
+
+
+# decides every pair of bots (bot1, bot2) in pairs at once: in each round, every pairing not yet decided plays
+# SPRT_OPENINGS new openings, each once with either bot first, all played together by bot.play_games(); a pairing is
+# decided once its SPRT is, or by score (then disc difference) after SPRT_GAMES, so lopsided pairings stop after a
+# round or two and the games go to close ones; returns (winner, games played, elo_interval() of bot1) for each pair
+def sprt_match(pairs):
+    scores = [[] for _ in pairs]
+    margins = [0] * len(pairs)
+    decided = [None] * len(pairs)
+    bound = math.log((1 - SPRT_ERROR) / SPRT_ERROR)
+    while None in decided:
+        playing = [i for i in range(len(pairs)) if decided[i] is None]
+        games = []
+        openings = []
+        for i in playing:
+            bot1, bot2 = pairs[i]
+            for _ in range(SPRT_OPENINGS):
+                start = opening()
+                games += [(bot1, bot2), (bot2, bot1)]
+                openings += [start, start]
+        results = iter(bot.play_games(games, openings))
+        for i in playing:
+            for _ in range(SPRT_OPENINGS):
+                # bot1's disc difference, playing O then X
+                for margin in (next(results), -next(results)):
+                    scores[i].append(1 if margin > 0 else 0 if margin < 0 else 0.5)
+                    margins[i] += margin
+            llr = sprt_llr(scores[i])
+            if llr >= bound or llr <= -bound or len(scores[i]) >= SPRT_GAMES:
+                ahead = llr if abs(llr) >= bound else sum(scores[i]) - len(scores[i]) / 2 or margins[i]
+                decided[i] = pairs[i][0] if ahead > 0 else pairs[i][1]
+    return [(decided[i], len(scores[i]), elo_interval(scores[i])) for i in range(len(pairs))]
+
+
 # plays a match between 2 bots, with bot1 going first, returns positive value if bot1 wins, negative if bot2 wins
 # played on static depth of 4 moves
 def startmatch(bot1, bot2, visuals, logging):
@@ -50,10 +286,15 @@ def startmatch(bot1, bot2, visuals, logging):
     str_board = 0
     # only logging until 35 pieces on board - end of early game
     pieces = 8
+    # every position a move is made in (see append_positions())
+    positions = []
     while flag1 or flag2:
         if logging and pieces < 36:
             str_board = to_string('O', state)
-        state, coord, flag1 = bot.main(bot1, player1, state)
+        discs = bot.to_bitboards(player1, state)
+        state, coord, flag1, value = bot.main(bot1, player1, state)
+        if flag1:
+            positions.append((player1, *discs, coord[0] * 12 + coord[1], value))
         if visuals and flag1:
             print("O plays ---------------")
             for row in state:
@@ -64,7 +305,10 @@ def startmatch(bot1, bot2, visuals, logging):
                 move1.append((str_board, coord))
                 pieces += 1
             str_board = to_string('X', state)
-        state, coord, flag2 = bot.main(bot2, player2, state)
+        discs = bot.to_bitboards(player2, state)
+        state, coord, flag2, value = bot.main(bot2, player2, state)
+        if flag2:
+            positions.append((player2, *discs, coord[0] * 12 + coord[1], value))
         if visuals and flag2:
             print("X plays ---------------")
             for row in state:
@@ -86,8 +330,9 @@ def startmatch(bot1, bot2, visuals, logging):
                 total2 += 1
     if visuals:
         print(bot1 if total1 - total2 > 0 else bot2)
-    # additionally return various move success rate statistics in logging mode
-    return (total1 - total2) if not logging else (bot1, total1, move1, bot2, total2, move2)
+    # disc difference and positions played, additionally various move success rate statistics in logging mode; the
+    # positions are appended to the database by the main process, as workers writing it at once would mix records
+    return (total1 - total2, positions) if not logging else (bot1, total1, move1, bot2, total2, move2, positions)
 
 
 # converts board information into 145 char string - 1st char denotes next to move
@@ -98,12 +343,47 @@ def to_string(side, board):
     return string
 
 
-def callback(c):
-    winners.append(c)
+# single elimination of bots (16, 8, 4...) down to the last 2, returned in bracket order; each game of a match (one
+# with either bot first) is queued on pool on its own, so a worker that is free takes whichever game is next, and a
+# match of the next round is queued as soon as both matches feeding it are decided rather than once the whole round is;
+# the positions of every game are appended to the position database as it finishes
+def knockout(pool, bots):
+    results = queue.Queue()
+    # bots of each round by bracket position, None until decided
+    rounds = [list(bots)]
+    while len(rounds[-1]) > 2:
+        rounds.append([None] * (len(rounds[-1]) // 2))
+    # disc difference of both games of each match (round, position), bot1 first then bot2 first
+    margins = {}
+
+    def start(r, k):
+        bot1, bot2 = rounds[r][2 * k], rounds[r][2 * k + 1]
+        margins[r, k] = [None, None]
+        for side, (first, second) in enumerate(((bot1, bot2), (bot2, bot1))):
+            pool.apply_async(startmatch, args=(first, second, False, False),
+                             callback=lambda result, game=(r, k, side): results.put((game, result)),
+                             error_callback=lambda error: results.put((None, error)))
+
+    for k in range(len(rounds[0]) // 2):
+        start(0, k)
+    while None in rounds[-1]:
+        game, result = results.get()
+        if game is None:
+            raise result
+        margin, positions = result
+        append_positions(positions, margin)
+        r, k, side = game
+        margins[r, k][side] = margin
+        if None not in margins[r, k]:
+            rounds[r + 1][k] = winner(rounds[r][2 * k], rounds[r][2 * k + 1], *margins[r, k])
+            # the other match feeding the next one is decided too
+            if r + 2 < len(rounds) and rounds[r + 1][k ^ 1] is not None:
+                start(r + 1, k // 2)
+    return rounds[-1]
 
 
 def robin_callback(c):
-    robin1, t1, move1, robin2, t2, move2 = c
+    robin1, t1, move1, robin2, t2, move2, positions = c
     if tuple(robin1) not in records:
         # wins as (O, X)
         records[tuple(robin1)] = [0, 0]
@@ -113,43 +393,41 @@ def robin_callback(c):
     # updates winner records
     records[tuple(robin1)][0] += 1 if t1 > t2 else 0
     records[tuple(robin2)][1] += 1 if t1 < t2 else 0
-    # adds move to opening book if it does not yet exist, or modifies it
-    for str_board, m in move1:
-        if str_board not in openings:
-            openings[str_board] = [[1 if t1 > t2 else 0, 1, m]]
-        else:
-            flag = False
-            for move_stats in openings[str_board]:
-                if m == move_stats[2]:
-                    move_stats[0] += 1 if t1 > t2 else 0
-                    move_stats[1] += 1
-                    flag = True
-                    break
-            if not flag:
-                openings[str_board].append([1 if t1 > t2 else 0, 1, m])
-    for str_board, m in move2:
-        if str_board not in openings:
-            openings[str_board] = [[1 if t1 < t2 else 0, 1, m]]
-        else:
-            flag = False
-            for move_stats in openings[str_board]:
-                if m == move_stats[2]:
-                    move_stats[0] += 1 if t1 < t2 else 0
-                    move_stats[1] += 1
-                    flag = True
-                    break
-            if not flag:
-                openings[str_board].append([1 if t1 < t2 else 0, 1, m])
+    # appends the moves of both sides to the game record stream, folded into the opening book after the tournament
+    homework.append_book(homework.game_records(move1, t1 > t2) + homework.game_records(move2, t1 < t2))
+    append_positions(positions, t1 - t2)
 
 
 if __name__ == '__main__':
     # set to True for match to display on command line, 1 match only
     sampleMatch = False
-    # set to True to log opening moves (< 36 discs on board) and write to openings.txt
+    # set to True to log opening moves (< 36 discs on board) and add them to openings.bin, and every position played
+    # to positions.bin
     learning = False
+    # set to True for training matches to be played a move ahead by bot.play_games(), all at once and as many games as
+    # each pairing needs (see sprt_match()), not searched twice
+    batched = False
+    # set to True to fit homework's pattern weights to the positions in positions.bin (see fit_patterns())
+    fitting = False
+    # set to True to fit the 10 heuristic values to the positions in positions.bin by least squares (see
+    # fit_heuristic()) in minutes, and match them against the refined heuristic as batched does
+    regression = False
+    # heuristic of homework.py, refined by training
+    refined = [0.185, 55.6, 0.75, 25, 0.04, 9.1, -0.55, -15, -0.68, -13.6]
     if sampleMatch:
         match([-0.4, 90, -0.1, 70, 0.7, -35, 0.2, 25, 0.6, -85],
               [-1.0, 60, -0.25, 85, 0.75, -90, 1.0, 100, -0.95, -50], True)
+    elif fitting or regression:
+        # self-play of the refined heuristic is recorded the first time, and fitted to from then on without replaying
+        if not os.path.exists(POSITION_FILE):
+            self_play(refined)
+        if fitting:
+            print(fit_patterns(iter_positions()))
+        else:
+            fitted = fit_heuristic(iter_positions())
+            print(fitted)
+            for w, games, (rating, low, high) in sprt_match([(fitted, refined)]):
+                print(w, games, round(rating), round(low), round(high))
     elif learning:
         # round-robin tournament on 'refined' bots in history.txt
         robin = [[-0.4, 90, -0.1, 70, 0.7, -35, 0.2, 25, 0.6, -85],
@@ -159,21 +437,19 @@ if __name__ == '__main__':
                 if line[0] == '[':
                     robin.append(eval(line.rstrip()))
         records = {}
-        openings = {}
+        # one process per core, every game of the tournament queued at once
+        pool = multiprocessing.Pool()
         for bot in robin:
-            pool = multiprocessing.Pool(processes=len(robin))
             for i in range(len(robin)):
                 pool.apply_async(startmatch, args=(bot, robin[i], False, True), callback=robin_callback)
-            pool.close()
-            pool.join()
+        pool.close()
+        pool.join()
         print("Final Scoring:")
         for bot, wins in records.items():
             print(wins[0], wins[1], bot)
-        # writes to file a flattened board as string and associated statistics
-        # format: {XXOX.XOX.......O.XOO....OXOO.XO...: [[wins, total, move], [wins, total, move]...], ...}
-        file = open("openings.txt", "w")
-        file.write(str(openings))
-        file.close()
+        # adds the games of this tournament to the opening book, to openings.bin; left in openings.log if stopped before
+        # here, which "python homework.py merge openings.bin openings.bin openings.log" then folds in just the same
+        homework.merge_books([homework.BOOK_FILE], streams=[homework.BOOK_STREAM])
     else:
         try:
             file = open("genetic_data.txt", "r+")
@@ -184,17 +460,21 @@ if __name__ == '__main__':
             # train for 10 generations
             it = 10
             gen = 4
+            # one process per core, kept for every generation
+            pool = multiprocessing.Pool()
             # getting 11 iterations for now, took 2 days at 4 hours each
             while it < 12:
-                while len(gen_data) > 2:
-                    # Top 16 -> top 8 -> top 4 -> top 2 -> save
-                    pool = multiprocessing.Pool(processes=len(gen_data) // 2)
-                    winners = []
-                    for i in range(1, len(gen_data), 2):
-                        pool.apply_async(match, args=(gen_data[i - 1], gen_data[i], False), callback=callback)
-                    pool.close()
-                    pool.join()
-                    gen_data = winners
+                # Top 16 -> top 8 -> top 4 -> top 2 -> save
+                while batched and len(gen_data) > 2:
+                    decided = sprt_match(list(zip(gen_data[0::2], gen_data[1::2])))
+                    for w, games, (rating, low, high) in decided:
+                        # games played, and Elo of the first bot of the pairing over the second
+                        print(games, round(rating), round(low), round(high))
+                    gen_data = [w for w, games, rating in decided]
+                # searched matches are still decided by their two games, one each way round; an SPRT would take
+                # hundreds of searched games a pairing (see sprt_match())
+                if not batched:
+                    gen_data = knockout(pool, gen_data)
                 gen += 1
                 print(it, gen, gen_data)
                 if gen == 10:
@@ -282,6 +562,7 @@ if __name__ == '__main__':
                 file.write(str(next_gen))
                 file.truncate()
                 gen_data = next_gen
+            pool.close()
             file.close()
         except FileNotFoundError:
             # seeding file with 16 random heuristic values